@@ -1,12 +1,182 @@
 import csv
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from xml.sax.saxutils import escape, quoteattr
+from concurrent.futures import ProcessPoolExecutor
+import io
+import itertools
+import random
 import zipfile
 import sys
-import uuid
 import os
 import re
 
+# Every <item> has the same shape, so it is filled in from text templates
+# (already indented for its place inside <section>) rather than built as an
+# ElementTree. The HTML wrappers around question and feedback text are stored
+# pre-escaped, so escape() runs once over each piece of user text and nothing
+# else; idents and titles are safe as they are.
+ITEM_TEMPLATE = """\
+      <item ident="%s" title="%s">
+        <itemmetadata>
+          <qtimetadata>
+            <qtimetadatafield>
+              <fieldlabel>question_type</fieldlabel>
+              <fieldentry>%s</fieldentry>
+            </qtimetadatafield>
+            <qtimetadatafield>
+              <fieldlabel>points_possible</fieldlabel>
+              <fieldentry>%s</fieldentry>
+            </qtimetadatafield>
+          </qtimetadata>
+        </itemmetadata>
+        <presentation>
+          <material>
+            <mattext texttype="text/html">&lt;div&gt;&lt;p&gt;%s&lt;/p&gt;&lt;/div&gt;</mattext>
+          </material>
+          <response_lid ident="response1" rcardinality="Single">
+            <render_choice>
+%s            </render_choice>
+          </response_lid>
+        </presentation>
+        <resprocessing>
+          <outcomes>
+            <decvar maxvalue="100" minvalue="0" varname="SCORE" vartype="Decimal" />
+          </outcomes>
+          <respcondition continue="No">
+            <conditionvar>
+              <varequal respident="response1">%s</varequal>
+            </conditionvar>
+            <setvar action="Set" varname="SCORE">100</setvar>
+          </respcondition>
+        </resprocessing>
+%s      </item>
+"""
+ANSWER_TEMPLATE = """\
+              <response_label ident="%s">
+                <material>
+                  <mattext texttype="text/plain">%s</mattext>
+                </material>
+              </response_label>
+"""
+FEEDBACK_TEMPLATE = """\
+        <itemfeedback ident="%s">
+          <flow_mat>
+            <material>
+              <mattext texttype="text/html">&lt;p&gt;%s&lt;/p&gt;</mattext>
+            </material>
+          </flow_mat>
+        </itemfeedback>
+"""
+
+# Rows handed to each worker process. A CSV that fits in one chunk (or a
+# single-CPU machine) is built in-process; workers would cost more than they save.
+ITEMS_PER_CHUNK = 500
+
+# The <questestinterop> envelope is written by hand so the <item>s can go
+# straight into the archive. In-process, rows are read ITEMS_PER_CHUNK at a
+# time and written as each chunk is read. With worker processes, executor.map
+# reads the whole CSV up front and the built chunks are held until they can be
+# written back in order.
+QTI_HEADER = (
+    "<?xml version='1.0' encoding='utf-8'?>\n"
+    '<questestinterop xmlns="http://www.imsglobal.org/xsd/ims_qtiasiv1p2" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xsi:schemaLocation="http://www.imsglobal.org/xsd/ims_qtiasiv1p2 http://www.imsglobal.org/xsd/ims_qtiasiv1p2p1.xsd">\n'
+    '  <assessment ident="{ident}" title={title}>\n'
+    '    <section ident="root_section">\n'
+)
+QTI_FOOTER = (
+    "    </section>\n"
+    "  </assessment>\n"
+    "</questestinterop>\n"
+)
+
+def make_id_generator():
+    """
+    Returns a function that produces a new unique "i<32 hex digits>" identifier per call.
+
+    Identifiers only need to be unique within the package, so they come from a
+    urandom-seeded random.Random rather than a system call per element. Each
+    worker process calls this itself: forked workers would otherwise inherit
+    the parent's generator state and repeat its identifiers.
+    """
+    getrandbits = random.Random(os.urandom(32)).getrandbits
+
+    def next_id():
+        return 'i%032x' % getrandbits(128)
+
+    return next_id
+
+def build_items_chunk(first_number, rows):
+    """
+    Worker for ProcessPoolExecutor: serializes the <item> elements for a run of CSV rows.
+
+    Args:
+        first_number (int): The question number of the first row in the chunk.
+        rows (list): The CSV rows to convert.
+
+    Returns:
+        tuple: (XML bytes for the items, list of each question's point value).
+    """
+    out = io.BytesIO()
+    next_id = make_id_generator()
+    points = [write_item(out, row, number, next_id) for number, row in enumerate(rows, first_number)]
+    return out.getvalue(), points
+
+def write_item(out, row, number, next_id):
+    """
+    Builds the <item> element for one CSV row and writes it to a binary stream.
+
+    Args:
+        out: A writable binary file object (e.g. an open zip member).
+        row (list): The CSV row, in the column layout described in the README.
+        number (int): The 1-based question number, used for the item title.
+        next_id (callable): Returns a fresh unique identifier on each call.
+
+    Returns:
+        float: The point value of the question.
+    """
+    # Map CSV columns to variables by position (column B is unused)
+    q_type, q_points, q_body, correct_ans_idx = row[0], row[2], row[3], row[4]
+    q_points = float(q_points) if q_points else 0.0
+
+    answers = row[5:10]
+    general_fb, correct_fb, incorrect_fb = row[10:13]
+    answer_fbs = row[13:18]
+
+    item_ident = next_id()
+    q_type_str = "multiple_choice_question" if q_type == "MC" else "multiple_response_question"
+
+    # --- Answers ---
+    answer_ids = []
+    answers_xml = []
+    for ans_text in answers:
+        if ans_text: # Only add non-empty answers
+            ans_ident = next_id()
+            answer_ids.append(ans_ident)
+            answers_xml.append(ANSWER_TEMPLATE % (ans_ident, escape(ans_text)))
+
+    correct_answer_id = answer_ids[int(correct_ans_idx) - 1]
+
+    # --- Feedback ---
+    feedbacks_xml = []
+    for fb_ident, fb_text in (("general_fb", general_fb), ("correct_fb", correct_fb), ("general_incorrect_fb", incorrect_fb)):
+        if fb_text:
+            feedbacks_xml.append(FEEDBACK_TEMPLATE % (fb_ident, escape(fb_text)))
+
+    for j, fb_text in enumerate(answer_fbs):
+        if fb_text:
+            feedbacks_xml.append(FEEDBACK_TEMPLATE % (f"{answer_ids[j]}_fb", escape(fb_text)))
+
+    item_xml = ITEM_TEMPLATE % (
+        item_ident, f"Question {number}", q_type_str, q_points,
+        escape(q_body), "".join(answers_xml),
+        correct_answer_id, "".join(feedbacks_xml),
+    )
+    out.write(item_xml.encode('utf-8'))
+
+    return q_points
+
 def create_qti_zip_from_csv(csv_path, zip_path='qti_export.zip', quiz_title=None):
     """
     Reads a CSV file and generates a QTI 1.2 compliant zip file.
@@ -19,103 +189,17 @@ def create_qti_zip_from_csv(csv_path, zip_path='qti_export.zip', quiz_title=None
     if not quiz_title:
         quiz_title = os.path.splitext(os.path.basename(csv_path))[0]
 
+    next_id = make_id_generator()
+
     # Generate unique identifiers for the quiz components
-    assessment_ident = f"i{uuid.uuid4().hex}"
-    dependency_ident = f"i{uuid.uuid4().hex}"
-    resource_ident = f"i{uuid.uuid4().hex}"
-    manifest_ident = f"i{uuid.uuid4().hex}"
+    assessment_ident = next_id()
+    dependency_ident = next_id()
+    resource_ident = next_id()
+    manifest_ident = next_id()
     
-    # --- 1. Build the main QTI XML content ---
-    qti_root = ET.Element("questestinterop", {
-        "xmlns": "http://www.imsglobal.org/xsd/ims_qtiasiv1p2",
-        "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-        "xsi:schemaLocation": "http://www.imsglobal.org/xsd/ims_qtiasiv1p2 http://www.imsglobal.org/xsd/ims_qtiasiv1p2p1.xsd"
-    })
-    assessment = ET.SubElement(qti_root, "assessment", {"ident": assessment_ident, "title": quiz_title})
-    section = ET.SubElement(assessment, "section", {"ident": "root_section"})
-
-    total_points = 0.0
+    qti_path = f"{assessment_ident}/{assessment_ident}.xml"
 
-    with open(csv_path, 'r', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        header = next(reader) # Skip header row
-
-        for i, row in enumerate(reader):
-            # Map CSV columns to variables
-            q_type, _, q_points, q_body, correct_ans_idx, *answers_and_feedback = row
-            q_points = float(q_points) if q_points else 0.0
-            total_points += q_points
-            
-            answers = answers_and_feedback[0:5]
-            feedbacks = {
-                'general': answers_and_feedback[5],
-                'correct': answers_and_feedback[6],
-                'incorrect': answers_and_feedback[7],
-                'individual': answers_and_feedback[8:13]
-            }
-
-            item_ident = f"i{uuid.uuid4().hex}"
-            item = ET.SubElement(section, "item", {"ident": item_ident, "title": f"Question {i+1}"})
-
-            # --- Item Metadata (Question Type, Points) ---
-            itemmetadata = ET.SubElement(item, "itemmetadata")
-            qtimetadata = ET.SubElement(itemmetadata, "qtimetadata")
-            
-            # Question Type
-            qtimetadatafield_type = ET.SubElement(qtimetadata, "qtimetadatafield")
-            ET.SubElement(qtimetadatafield_type, "fieldlabel").text = "question_type"
-            ET.SubElement(qtimetadatafield_type, "fieldentry").text = "multiple_choice_question" if q_type == "MC" else "multiple_response_question"
-
-            # Points Possible
-            qtimetadatafield_points = ET.SubElement(qtimetadata, "qtimetadatafield")
-            ET.SubElement(qtimetadatafield_points, "fieldlabel").text = "points_possible"
-            ET.SubElement(qtimetadatafield_points, "fieldentry").text = str(q_points)
-
-            # --- Presentation (Question and Answers) ---
-            presentation = ET.SubElement(item, "presentation")
-            material = ET.SubElement(presentation, "material")
-            ET.SubElement(material, "mattext", {"texttype": "text/html"}).text = f"<div><p>{q_body}</p></div>"
-            
-            response_lid = ET.SubElement(presentation, "response_lid", {"ident": "response1", "rcardinality": "Single"})
-            render_choice = ET.SubElement(response_lid, "render_choice")
-
-            answer_ids = []
-            for ans_text in answers:
-                if ans_text: # Only add non-empty answers
-                    ans_ident = f"i{uuid.uuid4().hex}"
-                    answer_ids.append(ans_ident)
-                    response_label = ET.SubElement(render_choice, "response_label", {"ident": ans_ident})
-                    ans_material = ET.SubElement(response_label, "material")
-                    ET.SubElement(ans_material, "mattext", {"texttype": "text/plain"}).text = ans_text
-            
-            # --- Resprocessing (Scoring Logic) ---
-            resprocessing = ET.SubElement(item, "resprocessing")
-            ET.SubElement(resprocessing, "outcomes").append(ET.Element("decvar", {"maxvalue": "100", "minvalue": "0", "varname": "SCORE", "vartype": "Decimal"}))
-            
-            # Correct answer condition
-            correct_answer_id = answer_ids[int(correct_ans_idx) - 1]
-            respcondition = ET.SubElement(resprocessing, "respcondition", {"continue": "No"})
-            conditionvar = ET.SubElement(respcondition, "conditionvar")
-            ET.SubElement(conditionvar, "varequal", {"respident": "response1"}).text = correct_answer_id
-            ET.SubElement(respcondition, "setvar", {"action": "Set", "varname": "SCORE"}).text = "100"
-
-            # --- Feedback ---
-            if feedbacks['general']:
-                fb_general = ET.SubElement(item, "itemfeedback", {"ident": "general_fb"})
-                ET.SubElement(ET.SubElement(fb_general, "flow_mat"), "material").append(ET.Element("mattext", {"texttype": "text/html"}, text=f"<p>{feedbacks['general']}</p>"))
-            if feedbacks['correct']:
-                fb_correct = ET.SubElement(item, "itemfeedback", {"ident": "correct_fb"})
-                ET.SubElement(ET.SubElement(fb_correct, "flow_mat"), "material").append(ET.Element("mattext", {"texttype": "text/html"}, text=f"<p>{feedbacks['correct']}</p>"))
-            if feedbacks['incorrect']:
-                fb_incorrect = ET.SubElement(item, "itemfeedback", {"ident": "general_incorrect_fb"})
-                ET.SubElement(ET.SubElement(fb_incorrect, "flow_mat"), "material").append(ET.Element("mattext", {"texttype": "text/html"}, text=f"<p>{feedbacks['incorrect']}</p>"))
-
-            for j, fb_text in enumerate(feedbacks['individual']):
-                if fb_text:
-                    fb_ind = ET.SubElement(item, "itemfeedback", {"ident": f"{answer_ids[j]}_fb"})
-                    ET.SubElement(ET.SubElement(fb_ind, "flow_mat"), "material").append(ET.Element("mattext", {"texttype": "text/html"}, text=f"<p>{fb_text}</p>"))
-
-    # --- 2. Build the imsmanifest.xml file ---
+    # --- 1. Build the imsmanifest.xml file ---
     manifest_root = ET.Element("manifest", {
         "identifier": manifest_ident,
         "xmlns": "http://www.imsglobal.org/xsd/imsccv1p1/imscp_v1p1",
@@ -131,33 +215,65 @@ def create_qti_zip_from_csv(csv_path, zip_path='qti_export.zip', quiz_title=None
     resource_meta = ET.SubElement(resources, "resource", {"identifier": dependency_ident, "type": "associatedcontent/imscc_xmlv1p1/learning-application-resource", "href": f"{assessment_ident}/assessment_meta.xml"})
     ET.SubElement(resource_meta, "file", {"href": f"{assessment_ident}/assessment_meta.xml"})
 
-    # --- 3. Build the assessment_meta.xml file ---
-    meta_root = ET.Element("quiz", {
-        "identifier": assessment_ident,
-        "xmlns": "http://canvas.instructure.com/xsd/cccv1p0",
-        "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-        "xsi:schemaLocation": "http://canvas.instructure.com/xsd/cccv1p0 https://canvas.instructure.com/xsd/cccv1p0.xsd"
-    })
-    ET.SubElement(meta_root, "title").text = quiz_title
-    ET.SubElement(meta_root, "points_possible").text = str(total_points)
-    ET.SubElement(meta_root, "quiz_type").text = "assignment"
-
-    # --- 4. Prettify and write XML files ---
-    def prettify(elem):
-        rough_string = ET.tostring(elem, 'utf-8')
-        reparsed = minidom.parseString(rough_string)
-        return reparsed.toprettyxml(indent="  ")
-
-    qti_xml_str = prettify(qti_root)
-    manifest_xml_str = prettify(manifest_root)
-    meta_xml_str = prettify(meta_root)
-
-    # --- 5. Create the zip archive ---
-    with zipfile.ZipFile(zip_path, 'w') as zf:
-        zf.writestr("imsmanifest.xml", manifest_xml_str)
-        zf.writestr(f"{assessment_ident}/{assessment_ident}.xml", qti_xml_str)
-        zf.writestr(f"{assessment_ident}/assessment_meta.xml", meta_xml_str)
-    
+    # Indents in place and streams the document into a new zip member
+    def write_xml(zf, name, elem):
+        ET.indent(elem, space="  ")
+        with zf.open(name, 'w') as fp:
+            ET.ElementTree(elem).write(fp, encoding='utf-8', xml_declaration=True)
+
+    total_points = 0.0
+
+    zf = None
+    try:
+        with open(csv_path, 'r', encoding='utf-8-sig', buffering=1 << 20, newline='') as csvfile, \
+                zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+            write_xml(zf, "imsmanifest.xml", manifest_root)
+
+            # --- 2. Stream the main QTI XML content, one <item> per CSV row ---
+            with zf.open(qti_path, 'w') as qti_file:
+                qti_file.write(QTI_HEADER.format(ident=assessment_ident, title=quoteattr(quiz_title)).encode('utf-8'))
+
+                reader = csv.reader(csvfile)
+                header = next(reader) # Skip header row
+
+                chunks = iter(lambda: list(itertools.islice(reader, ITEMS_PER_CHUNK)), [])
+                first_chunk = next(chunks, [])
+                second_chunk = next(chunks, [])
+                all_chunks = itertools.chain([first_chunk, second_chunk], chunks)
+
+                if second_chunk and (os.cpu_count() or 1) > 1:
+                    # Items are independent, so chunks are built in parallel and
+                    # written back in their original order
+                    with ProcessPoolExecutor() as executor:
+                        results = executor.map(build_items_chunk, itertools.count(1, ITEMS_PER_CHUNK), all_chunks)
+                        for items_xml, points in results:
+                            qti_file.write(items_xml)
+                            for q_points in points:
+                                total_points += q_points
+                else:
+                    for i, row in enumerate(itertools.chain.from_iterable(all_chunks)):
+                        total_points += write_item(qti_file, row, i + 1, next_id)
+
+                qti_file.write(QTI_FOOTER.encode('utf-8'))
+
+            # --- 3. Build the assessment_meta.xml file (needs the point total) ---
+            meta_root = ET.Element("quiz", {
+                "identifier": assessment_ident,
+                "xmlns": "http://canvas.instructure.com/xsd/cccv1p0",
+                "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+                "xsi:schemaLocation": "http://canvas.instructure.com/xsd/cccv1p0 https://canvas.instructure.com/xsd/cccv1p0.xsd"
+            })
+            ET.SubElement(meta_root, "title").text = quiz_title
+            ET.SubElement(meta_root, "points_possible").text = str(total_points)
+            ET.SubElement(meta_root, "quiz_type").text = "assignment"
+            write_xml(zf, f"{assessment_ident}/assessment_meta.xml", meta_root)
+    except Exception:
+        # Don't leave a half-written package behind (zf is only set once
+        # this call has created the archive)
+        if zf is not None:
+            os.remove(zip_path)
+        raise
+
     print(f"Successfully created QTI zip file at: {zip_path}")
 
 
@@ -1,53 +1,79 @@
 import csv
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from xml.sax.saxutils import quoteattr
 import zipfile
-import uuid
 import os
+import random
 import argparse
 import sys
 
+# Hand-written envelope around the streamed <item> elements
+QTI_HEADER = (
+    "<?xml version='1.0' encoding='utf-8'?>\n"
+    '<questestinterop xmlns="http://www.imsglobal.org/xsd/ims_qtiasiv1p2" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xsi:schemaLocation="http://www.imsglobal.org/xsd/ims_qtiasiv1p2 http://www.imsglobal.org/xsd/ims_qtiasiv1p2p1.xsd">\n'
+    '  <assessment ident="{ident}" title={title}>\n'
+    '    <section ident="root_section">\n'
+)
+QTI_FOOTER = "    </section>\n  </assessment>\n</questestinterop>\n"
+
+# IDs only need to be unique inside one package; seed once from urandom
+_rng = random.Random(os.urandom(32))
+
+def _ident():
+    return 'i%032x' % _rng.getrandbits(128)
+
 def create_qti_zip(csv_path, zip_path):
     quiz_title = os.path.splitext(os.path.basename(csv_path))[0]
     
     # Generate unique IDs for the package
-    assessment_id = f"i{uuid.uuid4().hex}"
-    manifest_id = f"i{uuid.uuid4().hex}"
-    dependency_id = f"i{uuid.uuid4().hex}"
-
-    # Setup XML root
-    qti_root = ET.Element("questestinterop", {
-        "xmlns": "http://www.imsglobal.org/xsd/ims_qtiasiv1p2",
-        "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-        "xsi:schemaLocation": "http://www.imsglobal.org/xsd/ims_qtiasiv1p2 http://www.imsglobal.org/xsd/ims_qtiasiv1p2p1.xsd"
-    })
-    assessment = ET.SubElement(qti_root, "assessment", {"ident": assessment_id, "title": quiz_title})
-    section = ET.SubElement(assessment, "section", {"ident": "root_section"})
+    assessment_id = _ident()
+    manifest_id = _ident()
+    dependency_id = _ident()
+
+    qti_path = f"{assessment_id}/{assessment_id}.xml"
 
     total_points = 0.0
     warnings = []
     question_count = 0
 
+    zf = None
     try:
-        with open(csv_path, 'r', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile)
-            
-            # Normalize headers (strip spaces)
-            reader.fieldnames = [name.strip() for name in reader.fieldnames]
+        with open(csv_path, 'r', encoding='utf-8-sig', buffering=1 << 20, newline='') as csvfile, \
+                zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf, \
+                zf.open(qti_path, 'w') as qti_file:
+            qti_file.write(QTI_HEADER.format(ident=assessment_id, title=quoteattr(quiz_title)).encode('utf-8'))
 
-            for i, row in enumerate(reader):
+            reader = csv.reader(csvfile)
+            
+            # Normalize headers (strip spaces) and resolve column positions once;
+            # columns missing from the header map to None
+            header = [name.strip() for name in next(reader)]
+            col_idx = {name: idx for idx, name in enumerate(header)}
+            TYPE, TITLE, POINTS, BODY, CORRECT = (col_idx.get(name) for name in ('Type', 'Title', 'Points', 'Question Body', 'Correct Answer'))
+            GENERAL_FB, CORRECT_FB, INCORRECT_FB = (col_idx.get(name) for name in ('General Feedback', 'Correct Feedback', 'Incorrect Feedback'))
+            OPTS = tuple(col_idx.get(f'Option {x}') for x in range(1, 6))
+            FBS = tuple(col_idx.get(f'Feedback {x}') for x in range(1, 6))
+            # Local aliases for the ~30 element constructors called per row
+            SE, E = ET.SubElement, ET.Element
+
+            for i, row in enumerate(filter(None, reader)): # Skip blank lines
                 row_num = i + 2 # Account for header and 0-index
+                if len(row) < len(header):
+                    row += [''] * (len(header) - len(row))
                 
                 # --- 1. Basic Data Extraction ---
-                q_type = row.get('Type', 'MC').upper().strip()
-                title = row.get('Title', f'Question {i+1}')
-                body = row.get('Question Body', '')
+                q_type = (row[TYPE] if TYPE is not None else 'MC').upper().strip()
+                title = row[TITLE] if TITLE is not None else f'Question {i+1}'
+                body = row[BODY] if BODY is not None else ''
                 
                 # --- 2. Validation: Points ---
+                raw_points = row[POINTS] if POINTS is not None else 0
                 try:
-                    points = float(row.get('Points', 0))
+                    points = float(raw_points)
                 except ValueError:
-                    warnings.append(f"Row {row_num}: Invalid points value '{row.get('Points')}'. Defaulting to 0.")
+                    warnings.append(f"Row {row_num}: Invalid points value '{raw_points}'. Defaulting to 0.")
                     points = 0.0
                 total_points += points
 
@@ -56,8 +82,8 @@ def create_qti_zip(csv_path, zip_path):
                 if q_type == 'TF':
                     answers = ["True", "False"]
                 elif q_type == 'MC':
-                    for x in range(1, 6):
-                        val = row.get(f'Option {x}', '').strip()
+                    for idx in OPTS:
+                        val = row[idx].strip() if idx is not None else ''
                         if val: answers.append(val)
                     
                     if not answers:
@@ -66,7 +92,7 @@ def create_qti_zip(csv_path, zip_path):
                     warnings.append(f"Row {row_num}: Unknown Type '{q_type}'. Defaulting to MC.")
                     
                 # --- 4. Validation: Correct Answer ---
-                raw_correct = row.get('Correct Answer', '').strip()
+                raw_correct = row[CORRECT].strip() if CORRECT is not None else ''
                 correct_idx = -1
                 
                 if raw_correct.isdigit():
@@ -80,69 +106,78 @@ def create_qti_zip(csv_path, zip_path):
                         correct_idx = -1 # Invalidate
 
                 # --- 5. Build XML Item ---
-                item = ET.SubElement(section, "item", {"ident": f"i{uuid.uuid4().hex}", "title": title})
+                item = E("item", {"ident": _ident(), "title": title})
                 question_count += 1
                 
                 # Metadata
-                meta = ET.SubElement(ET.SubElement(item, "itemmetadata"), "qtimetadata")
+                meta = SE(SE(item, "itemmetadata"), "qtimetadata")
                 
                 # Type Field
-                f_type = ET.SubElement(meta, "qtimetadatafield")
-                ET.SubElement(f_type, "fieldlabel").text = "question_type"
+                f_type = SE(meta, "qtimetadatafield")
+                SE(f_type, "fieldlabel").text = "question_type"
                 q_type_str = "true_false_question" if q_type == 'TF' else "multiple_choice_question"
-                ET.SubElement(f_type, "fieldentry").text = q_type_str
+                SE(f_type, "fieldentry").text = q_type_str
 
                 # Points Field
-                f_points = ET.SubElement(meta, "qtimetadatafield")
-                ET.SubElement(f_points, "fieldlabel").text = "points_possible"
-                ET.SubElement(f_points, "fieldentry").text = str(points)
+                f_points = SE(meta, "qtimetadatafield")
+                SE(f_points, "fieldlabel").text = "points_possible"
+                SE(f_points, "fieldentry").text = str(points)
 
                 # Presentation
-                pres = ET.SubElement(item, "presentation")
-                mat = ET.SubElement(pres, "material")
-                ET.SubElement(mat, "mattext", {"texttype": "text/html"}).text = f"<div><p>{body}</p></div>"
+                pres = SE(item, "presentation")
+                mat = SE(pres, "material")
+                SE(mat, "mattext", {"texttype": "text/html"}).text = f"<div><p>{body}</p></div>"
 
-                lid = ET.SubElement(pres, "response_lid", {"ident": "response1", "rcardinality": "Single"})
-                render = ET.SubElement(lid, "render_choice")
+                lid = SE(pres, "response_lid", {"ident": "response1", "rcardinality": "Single"})
+                render = SE(lid, "render_choice")
 
                 # Generate IDs for answers
                 answer_ids = []
                 for ans_text in answers:
-                    a_id = f"i{uuid.uuid4().hex}"
+                    a_id = _ident()
                     answer_ids.append(a_id)
-                    label = ET.SubElement(render, "response_label", {"ident": a_id})
-                    ET.SubElement(ET.SubElement(label, "material"), "mattext", {"texttype": "text/plain"}).text = ans_text
+                    label = SE(render, "response_label", {"ident": a_id})
+                    SE(SE(label, "material"), "mattext", {"texttype": "text/plain"}).text = ans_text
 
                 # Processing (Scoring)
-                res = ET.SubElement(item, "resprocessing")
-                ET.SubElement(res, "outcomes").append(ET.Element("decvar", {"maxvalue": "100", "minvalue": "0", "varname": "SCORE", "vartype": "Decimal"}))
+                res = SE(item, "resprocessing")
+                SE(res, "outcomes").append(E("decvar", {"maxvalue": "100", "minvalue": "0", "varname": "SCORE", "vartype": "Decimal"}))
                 
                 if correct_idx != -1:
                     correct_id = answer_ids[correct_idx]
-                    cond = ET.SubElement(res, "respcondition", {"continue": "No"})
-                    ET.SubElement(ET.SubElement(cond, "conditionvar"), "varequal", {"respident": "response1"}).text = correct_id
-                    ET.SubElement(cond, "setvar", {"action": "Set", "varname": "SCORE"}).text = "100"
+                    cond = SE(res, "respcondition", {"continue": "No"})
+                    SE(SE(cond, "conditionvar"), "varequal", {"respident": "response1"}).text = correct_id
+                    SE(cond, "setvar", {"action": "Set", "varname": "SCORE"}).text = "100"
 
                 # Feedback Handling
                 def add_feedback(ident, text):
                     if text:
-                        fb = ET.SubElement(item, "itemfeedback", {"ident": ident})
-                        ET.SubElement(ET.SubElement(fb, "flow_mat"), "material").append(
-                            ET.Element("mattext", {"texttype": "text/html"}, text=f"<p>{text}</p>")
-                        )
-
-                add_feedback("general_fb", row.get('General Feedback'))
-                add_feedback("correct_fb", row.get('Correct Feedback'))
-                add_feedback("general_incorrect_fb", row.get('Incorrect Feedback'))
+                        fb = SE(item, "itemfeedback", {"ident": ident})
+                        fb_mat = SE(SE(fb, "flow_mat"), "material")
+                        SE(fb_mat, "mattext", {"texttype": "text/html"}).text = f"<p>{text}</p>"
+
+                if GENERAL_FB is not None: add_feedback("general_fb", row[GENERAL_FB])
+                if CORRECT_FB is not None: add_feedback("correct_fb", row[CORRECT_FB])
+                if INCORRECT_FB is not None: add_feedback("general_incorrect_fb", row[INCORRECT_FB])
                 
                 # Per-answer feedback (Only for MC usually, but code handles TF cleanly too)
                 if q_type != 'TF': 
-                    for x in range(1, 6):
-                        if x-1 < len(answer_ids):
-                            add_feedback(f"{answer_ids[x-1]}_fb", row.get(f'Feedback {x}'))
+                    for a_id, idx in zip(answer_ids, FBS):
+                        if idx is not None:
+                            add_feedback(f"{a_id}_fb", row[idx])
+
+                # Stream the finished item out; only one item is held in memory
+                ET.indent(item, space="  ", level=3)
+                qti_file.write(b"      ")
+                ET.ElementTree(item).write(qti_file, encoding='utf-8')
+                qti_file.write(b"\n")
+
+            qti_file.write(QTI_FOOTER.encode('utf-8'))
 
     except Exception as e:
         print(f"CRITICAL ERROR: Failed to read CSV. {e}")
+        if zf is not None:
+            os.remove(zip_path) # Don't leave a half-written package behind
         return
 
     # --- Print Warnings ---
@@ -154,7 +189,7 @@ def create_qti_zip(csv_path, zip_path):
     else:
         print("\n✅  Validation passed: No errors found in CSV.")
 
-    # --- Write Files (Manifest, Meta, Zip) ---
+    # --- Append Remaining Files (Manifest, Meta) ---
     manifest = ET.Element("manifest", {
         "identifier": manifest_id,
         "xmlns": "http://www.imsglobal.org/xsd/imsccv1p1/imscp_v1p1",
@@ -180,16 +215,16 @@ def create_qti_zip(csv_path, zip_path):
     ET.SubElement(meta_root, "points_possible").text = str(total_points)
     ET.SubElement(meta_root, "quiz_type").text = "assignment"
 
-    # Prettify helper
-    def prettify(elem):
-        rough = ET.tostring(elem, 'utf-8')
-        return minidom.parseString(rough).toprettyxml(indent="  ")
+    # Write helper (indents in place, streams UTF-8 straight into the zip member)
+    def write_xml(zf, name, elem):
+        ET.indent(elem, space="  ")
+        with zf.open(name, 'w') as fp:
+            ET.ElementTree(elem).write(fp, encoding='utf-8', xml_declaration=True)
 
     try:
-        with zipfile.ZipFile(zip_path, 'w') as zf:
-            zf.writestr("imsmanifest.xml", prettify(manifest))
-            zf.writestr(f"{assessment_id}/{assessment_id}.xml", prettify(qti_root))
-            zf.writestr(f"{assessment_id}/assessment_meta.xml", prettify(meta_root))
+        with zipfile.ZipFile(zip_path, 'a', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+            write_xml(zf, "imsmanifest.xml", manifest)
+            write_xml(zf, f"{assessment_id}/assessment_meta.xml", meta_root)
         
         print(f"Successfully created QTI zip: {zip_path}")
         print(f"Total Questions: {question_count}")
@@ -197,6 +232,8 @@ def create_qti_zip(csv_path, zip_path):
 
     except Exception as e:
         print(f"Error writing zip file: {e}")
+        if os.path.exists(zip_path):
+            os.remove(zip_path) # A package without its manifest can't be imported
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert CSV to QTI Zip")
@@ -1,17 +1,47 @@
 import csv
-import xml.etree.ElementTree as ET
+try:
+    from lxml import etree as ET
+    # lxml would keep comments and processing instructions as child nodes,
+    # cutting .text short where ElementTree doesn't
+    _PARSE_OPTIONS = {'remove_comments': True, 'remove_pis': True}
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _PARSE_OPTIONS = {}
 import re
 import zipfile
 import sys
 
+_TAG_RE = re.compile('<[^<]+?>')
+
+# Clark-notation ({namespace}tag) names. iter()/find() given a plain tag like
+# these walk the tree in C instead of going through ElementPath with a prefix map.
+_IMS = '{http://www.imsglobal.org/xsd/ims_qtiasiv1p2}'
+_ITEM = _IMS + 'item'
+_QTIMETADATAFIELD = _IMS + 'qtimetadatafield'
+_FIELDLABEL = _IMS + 'fieldlabel'
+_FIELDENTRY = _IMS + 'fieldentry'
+_PRESENTATION = _IMS + 'presentation'
+_MATTEXT = _IMS + 'mattext'
+_RENDER_CHOICE = _IMS + 'render_choice'
+_RESPONSE_LABEL = _IMS + 'response_label'
+_RESPCONDITION = _IMS + 'respcondition'
+_SETVAR = _IMS + 'setvar'
+_VAREQUAL = _IMS + 'varequal'
+_ITEMFEEDBACK = _IMS + 'itemfeedback'
+
 def clean_html(raw_html):
     """
     Removes HTML tags from a string.
     """
     if not raw_html:
         return ""
-    clean_text = re.sub('<[^<]+?>', '', raw_html)
-    return clean_text.strip()
+    return _TAG_RE.sub('', raw_html).strip()
+
+def find_first(elem, tag):
+    """
+    Returns the first element with the given tag at or below elem, or None.
+    """
+    return next(elem.iter(tag), None)
 
 def convert_qti_to_csv(zip_file_path, output_csv_path='quiz_export.csv'):
     """
@@ -34,74 +64,65 @@ def convert_qti_to_csv(zip_file_path, output_csv_path='quiz_export.csv'):
                 return
 
             with z.open(qti_xml_filename) as xml_file:
-                ns = {'ims': 'http://www.imsglobal.org/xsd/ims_qtiasiv1p2'}
-                tree = ET.parse(xml_file)
-                root = tree.getroot()
-
-                with open(output_csv_path, 'w', newline='', encoding='utf-8') as csv_file:
-                    writer = csv.writer(csv_file)
-                    header = [
-                        'Type (MC/MR)', 'Not Used', 'Point Value', 'Question Body',
-                        'Correct Answer (1-5)', 'Answer A', 'Answer B', 'Answer C', 
-                        'Answer D', 'Answer E', 'General Comments', 
-                        'Correct Answer Comment', 'Wrong Answer Comment',
-                        'Feedback for A', 'Feedback for B', 'Feedback for C',
-                        'Feedback for D', 'Feedback for E'
-                    ]
-                    writer.writerow(header)
-
-                    for item in root.findall('.//ims:item', ns):
+                # The whole file is parsed before the CSV is opened, so a malformed
+                # export leaves an existing CSV alone
+                rows = []
+                for event, item in ET.iterparse(xml_file, events=('end',), **_PARSE_OPTIONS):
+                    if item.tag == _ITEM:
                         csv_row = [""] * 18
                         
                         # --- Columns A & C: Question Type & Points (FIXED) ---
-                        for field in item.findall('.//ims:qtimetadatafield', ns):
-                            label_elem = field.find('ims:fieldlabel', ns)
+                        for field in item.iter(_QTIMETADATAFIELD):
+                            label_elem = field.find(_FIELDLABEL)
                             if label_elem is not None:
                                 if label_elem.text == 'question_type':
-                                    q_type_elem = field.find('ims:fieldentry', ns)
+                                    q_type_elem = field.find(_FIELDENTRY)
                                     if q_type_elem is not None and q_type_elem.text == 'multiple_choice_question':
                                         csv_row[0] = 'MC'
                                 elif label_elem.text == 'points_possible':
-                                    points_elem = field.find('ims:fieldentry', ns)
+                                    points_elem = field.find(_FIELDENTRY)
                                     if points_elem is not None and points_elem.text:
                                         points = float(points_elem.text)
                                         csv_row[2] = f"{points:.2f}"
 
                         # --- Column D: Question Body ---
-                        question_body_elem = item.find('.//ims:presentation//ims:mattext', ns)
+                        question_body_elem = next((m for p in item.iter(_PRESENTATION) for m in p.iter(_MATTEXT)), None)
                         if question_body_elem is not None:
                             csv_row[3] = clean_html(question_body_elem.text)
                         
                         # --- Columns F-J: Answer Choices & Their IDs ---
                         answers, answer_ids = [], []
-                        for i, label in enumerate(item.findall('.//ims:render_choice/ims:response_label', ns)):
-                            answer_text_elem = label.find('.//ims:mattext', ns)
+                        id_to_pos = {}
+                        labels = [label for choice in item.iter(_RENDER_CHOICE) for label in choice.findall(_RESPONSE_LABEL)]
+                        for i, label in enumerate(labels):
+                            answer_text_elem = find_first(label, _MATTEXT)
                             answer_text = clean_html(answer_text_elem.text) if answer_text_elem is not None else ""
                             answer_id = label.get('ident')
                             answers.append(answer_text)
                             answer_ids.append(answer_id)
+                            id_to_pos.setdefault(answer_id, i)
                             if i < 5:
                                 csv_row[5 + i] = answer_text
 
                         # --- Column E: Correct Answer ---
                         correct_answer_id = None
-                        for condition in item.findall('.//ims:respcondition', ns):
-                            setvar = condition.find('.//ims:setvar[@varname="SCORE"]', ns)
+                        for condition in item.iter(_RESPCONDITION):
+                            setvar = next((sv for sv in condition.iter(_SETVAR) if sv.get('varname') == 'SCORE'), None)
                             if setvar is not None and setvar.text == '100' and setvar.get('action') == 'Set':
-                                varequal = condition.find('.//ims:varequal', ns)
+                                varequal = find_first(condition, _VAREQUAL)
                                 if varequal is not None:
                                     correct_answer_id = varequal.text
                                     break 
 
-                        if correct_answer_id and correct_answer_id in answer_ids:
-                           correct_answer_index = answer_ids.index(correct_answer_id)
-                           csv_row[4] = str(correct_answer_index + 1)
+                        correct_answer_index = id_to_pos.get(correct_answer_id)
+                        if correct_answer_id and correct_answer_index is not None:
+                            csv_row[4] = str(correct_answer_index + 1)
 
                         # --- Columns K-R: Feedback ---
                         feedback_map = {}
-                        for fb in item.findall('.//ims:itemfeedback', ns):
+                        for fb in item.iter(_ITEMFEEDBACK):
                             ident = fb.get('ident')
-                            fb_text_elem = fb.find('.//ims:mattext', ns)
+                            fb_text_elem = find_first(fb, _MATTEXT)
                             feedback_text = clean_html(fb_text_elem.text) if fb_text_elem is not None else ""
                             feedback_map[ident] = feedback_text
                         
@@ -115,7 +136,25 @@ def convert_qti_to_csv(zip_file_path, output_csv_path='quiz_export.csv'):
                                 if feedback_key in feedback_map:
                                     csv_row[13 + i] = feedback_map[feedback_key]
 
-                        writer.writerow(csv_row)
+                        rows.append(csv_row)
+                        item.clear()
+                        # lxml also keeps the cleared siblings reachable from the parent
+                        if hasattr(item, 'getprevious'):
+                            while item.getprevious() is not None:
+                                del item.getparent()[0]
+
+                with open(output_csv_path, 'w', newline='', encoding='utf-8') as csv_file:
+                    writer = csv.writer(csv_file)
+                    header = [
+                        'Type (MC/MR)', 'Not Used', 'Point Value', 'Question Body',
+                        'Correct Answer (1-5)', 'Answer A', 'Answer B', 'Answer C', 
+                        'Answer D', 'Answer E', 'General Comments', 
+                        'Correct Answer Comment', 'Wrong Answer Comment',
+                        'Feedback for A', 'Feedback for B', 'Feedback for C',
+                        'Feedback for D', 'Feedback for E'
+                    ]
+                    writer.writerow(header)
+                    writer.writerows(rows)
                 print(f"Successfully created CSV file at: {output_csv_path}")
 
     except FileNotFoundError:
@@ -1,9 +1,25 @@
 import csv
-import xml.etree.ElementTree as ET
+try:
+    from lxml import etree as ET
+    # Without these, lxml keeps comments and processing instructions as child
+    # nodes, so .text (and XPath's text()) would stop at the first one
+    _PARSE_OPTIONS = {'remove_comments': True, 'remove_pis': True}
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _PARSE_OPTIONS = {}
 import re
 import zipfile
 import sys
 import os
+import itertools
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+_TAG_RE = re.compile('<[^<]+?>')
+# Characters dropped from quiz titles when naming the output CSVs. ASCII titles
+# go through an equivalent str.translate() deletion table instead of the regex.
+_SANITIZE_RE = re.compile(r'[^\w\s-]')
+_SANITIZE_ASCII = str.maketrans('', '', ''.join(c for c in map(chr, range(128)) if _SANITIZE_RE.match(c)))
 
 def clean_html(raw_html):
     """
@@ -11,8 +27,179 @@ def clean_html(raw_html):
     """
     if not raw_html:
         return ""
-    clean_text = re.sub('<[^<]+?>', '', raw_html)
-    return clean_text.strip()
+    return _strip_tags(raw_html)
+
+@functools.lru_cache(maxsize=4096)
+def _strip_tags(raw_html):
+    return _TAG_RE.sub('', raw_html).strip()
+
+# Namespace of everything inside a QTI assessment file, as a prefix map for
+# XPath and as the Clark-notation ({namespace}tag) prefix ElementTree matches on
+_QTI_NS = {'ims': 'http://www.imsglobal.org/xsd/ims_qtiasiv1p2'}
+_IMS = '{%s}' % _QTI_NS['ims']
+_ITEM = _IMS + 'item'
+
+def compile_path(path):
+    """
+    Returns a function that maps an element to the list of its matches for path.
+
+    Under lxml the path is compiled once into an XPath evaluator that runs in
+    libxml2. With ElementTree a single descendant step ('.//ims:tag') becomes an
+    iter() over the Clark tag, which scans in C; anything else goes through
+    findall() with the prefix already expanded.
+    """
+    if hasattr(ET, 'XPath'):
+        return ET.XPath(path, namespaces=_QTI_NS)
+    step = path[len('.//'):]
+    if path.startswith('.//ims:') and not any(c in step for c in '/['):
+        tag = _IMS + step[len('ims:'):]
+        return lambda elem: list(elem.iter(tag))
+    clark_path = path.replace('ims:', _IMS)
+    return lambda elem: elem.findall(clark_path)
+
+def first(matches):
+    """
+    Returns the first element of a match list, or None if it is empty.
+    """
+    return matches[0] if matches else None
+
+# Item-relative paths evaluated for every question
+_META_FIELDS = compile_path('.//ims:qtimetadatafield')
+_FIELD_LABEL = compile_path('ims:fieldlabel')
+_FIELD_ENTRY = compile_path('ims:fieldentry')
+_BODY_MATTEXT = compile_path('.//ims:presentation//ims:mattext')
+_ANSWER_LABELS = compile_path('.//ims:render_choice/ims:response_label')
+_RESPCONDITIONS = compile_path('.//ims:respcondition')
+_SCORE_SETVAR = compile_path('.//ims:setvar[@varname="SCORE"]')
+_VAREQUAL = compile_path('.//ims:varequal')
+_FEEDBACKS = compile_path('.//ims:itemfeedback')
+_MATTEXT = compile_path('.//ims:mattext')
+
+# Under lxml, the correct answer's <varequal> (the first one in the first
+# respcondition whose SCORE setvar sets 100) is matched by a single XPath query
+if hasattr(ET, 'XPath'):
+    _CORRECT_VAREQUAL = ET.XPath(
+        '(.//ims:respcondition'
+        '[(.//ims:setvar[@varname="SCORE"])[1][@action="Set" and text()="100"]]'
+        '[.//ims:varequal])[1]/descendant::ims:varequal[1]',
+        namespaces=_QTI_NS)
+else:
+    _CORRECT_VAREQUAL = None
+
+def find_correct_answer_id(item):
+    """
+    Returns the answer ident that the item's response processing scores as correct, or None.
+    """
+    if _CORRECT_VAREQUAL is not None:
+        varequal = first(_CORRECT_VAREQUAL(item))
+        return varequal.text if varequal is not None else None
+
+    for condition in _RESPCONDITIONS(item):
+        setvar = first(_SCORE_SETVAR(condition))
+        if setvar is not None and setvar.text == '100' and setvar.get('action') == 'Set':
+            varequal = first(_VAREQUAL(condition))
+            if varequal is not None:
+                return varequal.text
+    return None
+
+def convert_quiz(zip_file_path, qti_xml_filename, output_csv_path):
+    """
+    Converts one quiz (QTI XML file) inside a QTI zip file into a CSV file.
+
+    The zip is opened here rather than passed in so that quizzes can be
+    converted in separate worker processes.
+
+    Args:
+        zip_file_path (str): The file path to the QTI zip file.
+        qti_xml_filename (str): The quiz's XML file within the zip.
+        output_csv_path (str): The path for the output CSV file.
+
+    Returns:
+        str: output_csv_path, once the file has been written.
+    """
+    rows = []
+    with zipfile.ZipFile(zip_file_path, 'r') as z, z.open(qti_xml_filename) as xml_file:
+        try:
+            for event, item in ET.iterparse(xml_file, events=('end',), **_PARSE_OPTIONS):
+                if item.tag != _ITEM:
+                    continue
+
+                csv_row = [""] * 18
+                
+                # One pass over the metadata fields: label -> entry text
+                meta = {}
+                for field in _META_FIELDS(item):
+                    label_elem = first(_FIELD_LABEL(field))
+                    if label_elem is not None and label_elem.text:
+                        entry_elem = first(_FIELD_ENTRY(field))
+                        meta[label_elem.text] = entry_elem.text if entry_elem is not None else None
+
+                if meta.get('question_type') == 'multiple_choice_question':
+                    csv_row[0] = 'MC'
+                points_text = meta.get('points_possible')
+                if points_text:
+                    csv_row[2] = f"{float(points_text):.2f}"
+
+                question_body_elem = first(_BODY_MATTEXT(item))
+                if question_body_elem is not None:
+                    csv_row[3] = clean_html(question_body_elem.text)
+                
+                answers, answer_ids = [], []
+                id_to_pos = {}
+                for i, label in enumerate(_ANSWER_LABELS(item)):
+                    answer_text_elem = first(_MATTEXT(label))
+                    answer_text = clean_html(answer_text_elem.text) if answer_text_elem is not None else ""
+                    answer_id = label.get('ident')
+                    answers.append(answer_text)
+                    answer_ids.append(answer_id)
+                    id_to_pos.setdefault(answer_id, i)
+                    if i < 5:
+                        csv_row[5 + i] = answer_text
+
+                correct_answer_id = find_correct_answer_id(item)
+                correct_answer_index = id_to_pos.get(correct_answer_id)
+                if correct_answer_id and correct_answer_index is not None:
+                   csv_row[4] = str(correct_answer_index + 1)
+
+                feedback_elems = _FEEDBACKS(item)
+                if feedback_elems:
+                    feedback_map = {}
+                    for fb in feedback_elems:
+                        ident = fb.get('ident')
+                        fb_text_elem = first(_MATTEXT(fb))
+                        feedback_text = clean_html(fb_text_elem.text) if fb_text_elem is not None else ""
+                        feedback_map[ident] = feedback_text
+
+                    csv_row[10] = feedback_map.get('general_fb', '')
+                    csv_row[11] = feedback_map.get('correct_fb', '')
+                    csv_row[12] = feedback_map.get('general_incorrect_fb', '')
+
+                    for i, ans_id in enumerate(answer_ids[:5]):
+                        csv_row[13 + i] = feedback_map.get(f"{ans_id}_fb", '')
+
+                rows.append(csv_row)
+                item.clear()
+                # lxml also keeps the cleared siblings reachable from the parent
+                if hasattr(item, 'getprevious'):
+                    while item.getprevious() is not None:
+                        del item.getparent()[0]
+        except ET.ParseError as e:
+            # lxml's XMLSyntaxError can't be pickled back from a worker process
+            raise SyntaxError(str(e)) from None
+
+    with open(output_csv_path, 'w', newline='', encoding='utf-8', buffering=1 << 20) as csv_file:
+        writer = csv.writer(csv_file)
+        header = [
+            'Type (MC/MR)', 'Not Used', 'Point Value', 'Question Body',
+            'Correct Answer (1-5)', 'Answer A', 'Answer B', 'Answer C', 
+            'Answer D', 'Answer E', 'General Comments', 
+            'Correct Answer Comment', 'Wrong Answer Comment',
+            'Feedback for A', 'Feedback for B', 'Feedback for C',
+            'Feedback for D', 'Feedback for E'
+        ]
+        writer.writerow(header)
+        writer.writerows(rows)
+    return output_csv_path
 
 def convert_qti_to_csv(zip_file_path, output_dir='csv_output'):
     """
@@ -27,12 +214,12 @@ def convert_qti_to_csv(zip_file_path, output_dir='csv_output'):
 
     try:
         with zipfile.ZipFile(zip_file_path, 'r') as z:
-            manifest_xml = z.read('imsmanifest.xml')
-            manifest_root = ET.fromstring(manifest_xml)
+            # Parse straight from the zip stream rather than reading the member into bytes first
+            with z.open('imsmanifest.xml') as manifest_file:
+                manifest_root = ET.parse(manifest_file).getroot()
             
             ns_map = {
-                'imscp': 'http://www.imsglobal.org/xsd/imsccv1p1/imscp_v1p1',
-                'ims': 'http://www.imsglobal.org/xsd/ims_qtiasiv1p2'
+                'imscp': 'http://www.imsglobal.org/xsd/imsccv1p1/imscp_v1p1'
             }
 
             resources = manifest_root.findall('.//imscp:resource[@type="imsqti_xmlv1p2"]', ns_map)
@@ -41,99 +228,45 @@ def convert_qti_to_csv(zip_file_path, output_dir='csv_output'):
                 print("Error: No QTI XML resources found in the manifest.")
                 return
 
+            # identifier -> <resource>, so each quiz's meta file is found without rescanning the manifest
+            resource_by_id = {r.get('identifier'): r for r in manifest_root.iterfind('.//imscp:resource', ns_map)}
+
+            qti_xml_filenames, output_csv_paths = [], []
             for resource in resources:
                 qti_xml_filename = resource.find('imscp:file', ns_map).get('href')
                 
                 # Extract quiz title from assessment_meta.xml
                 dependency_id = resource.find('imscp:dependency', ns_map).get('identifierref')
-                meta_resource = manifest_root.find(f'.//imscp:resource[@identifier="{dependency_id}"]', ns_map)
+                meta_resource = resource_by_id.get(dependency_id)
                 meta_xml_filename = meta_resource.get('href')
                 
                 with z.open(meta_xml_filename) as meta_xml_file:
-                    meta_tree = ET.parse(meta_xml_file)
+                    meta_tree = ET.parse(meta_xml_file, ET.XMLParser(**_PARSE_OPTIONS))
                     quiz_title = meta_tree.find('.//{http://canvas.instructure.com/xsd/cccv1p0}title').text
-                    sanitized_title = re.sub(r'[^\w\s-]', '', quiz_title).strip().replace(' ', '_')
+                    if quiz_title.isascii():
+                        sanitized_title = quiz_title.translate(_SANITIZE_ASCII)
+                    else:
+                        sanitized_title = _SANITIZE_RE.sub('', quiz_title)
+                    sanitized_title = sanitized_title.strip().replace(' ', '_')
                     output_csv_path = os.path.join(output_dir, f"{sanitized_title}.csv")
 
+                qti_xml_filenames.append(qti_xml_filename)
+                output_csv_paths.append(output_csv_path)
 
-                with z.open(qti_xml_filename) as xml_file:
-                    tree = ET.parse(xml_file)
-                    root = tree.getroot()
-
-                    with open(output_csv_path, 'w', newline='', encoding='utf-8') as csv_file:
-                        writer = csv.writer(csv_file)
-                        header = [
-                            'Type (MC/MR)', 'Not Used', 'Point Value', 'Question Body',
-                            'Correct Answer (1-5)', 'Answer A', 'Answer B', 'Answer C', 
-                            'Answer D', 'Answer E', 'General Comments', 
-                            'Correct Answer Comment', 'Wrong Answer Comment',
-                            'Feedback for A', 'Feedback for B', 'Feedback for C',
-                            'Feedback for D', 'Feedback for E'
-                        ]
-                        writer.writerow(header)
-
-                        for item in root.findall('.//ims:item', ns_map):
-                            csv_row = [""] * 18
-                            
-                            for field in item.findall('.//ims:qtimetadatafield', ns_map):
-                                label_elem = field.find('ims:fieldlabel', ns_map)
-                                if label_elem is not None:
-                                    if label_elem.text == 'question_type':
-                                        q_type_elem = field.find('ims:fieldentry', ns_map)
-                                        if q_type_elem is not None and q_type_elem.text == 'multiple_choice_question':
-                                            csv_row[0] = 'MC'
-                                    elif label_elem.text == 'points_possible':
-                                        points_elem = field.find('ims:fieldentry', ns_map)
-                                        if points_elem is not None and points_elem.text:
-                                            points = float(points_elem.text)
-                                            csv_row[2] = f"{points:.2f}"
-
-                            question_body_elem = item.find('.//ims:presentation//ims:mattext', ns_map)
-                            if question_body_elem is not None:
-                                csv_row[3] = clean_html(question_body_elem.text)
-                            
-                            answers, answer_ids = [], []
-                            for i, label in enumerate(item.findall('.//ims:render_choice/ims:response_label', ns_map)):
-                                answer_text_elem = label.find('.//ims:mattext', ns_map)
-                                answer_text = clean_html(answer_text_elem.text) if answer_text_elem is not None else ""
-                                answer_id = label.get('ident')
-                                answers.append(answer_text)
-                                answer_ids.append(answer_id)
-                                if i < 5:
-                                    csv_row[5 + i] = answer_text
-
-                            correct_answer_id = None
-                            for condition in item.findall('.//ims:respcondition', ns_map):
-                                setvar = condition.find('.//ims:setvar[@varname="SCORE"]', ns_map)
-                                if setvar is not None and setvar.text == '100' and setvar.get('action') == 'Set':
-                                    varequal = condition.find('.//ims:varequal', ns_map)
-                                    if varequal is not None:
-                                        correct_answer_id = varequal.text
-                                        break 
-
-                            if correct_answer_id and correct_answer_id in answer_ids:
-                               correct_answer_index = answer_ids.index(correct_answer_id)
-                               csv_row[4] = str(correct_answer_index + 1)
-
-                            feedback_map = {}
-                            for fb in item.findall('.//ims:itemfeedback', ns_map):
-                                ident = fb.get('ident')
-                                fb_text_elem = fb.find('.//ims:mattext', ns_map)
-                                feedback_text = clean_html(fb_text_elem.text) if fb_text_elem is not None else ""
-                                feedback_map[ident] = feedback_text
-                            
-                            csv_row[10] = feedback_map.get('general_fb', '')
-                            csv_row[11] = feedback_map.get('correct_fb', '')
-                            csv_row[12] = feedback_map.get('general_incorrect_fb', '')
-                            
-                            for i, ans_id in enumerate(answer_ids):
-                                if i < 5:
-                                    feedback_key = f"{ans_id}_fb"
-                                    if feedback_key in feedback_map:
-                                        csv_row[13 + i] = feedback_map[feedback_key]
-
-                            writer.writerow(csv_row)
+        # Each quiz is an independent XML file, so with several of them (and more
+        # than one CPU) they are converted side by side in worker processes.
+        # Quizzes whose titles sanitize to the same file name (compared without
+        # case, for case-insensitive filesystems) are converted in manifest order
+        # instead, so the last one wins just as it always has.
+        distinct_paths = {os.path.abspath(path).casefold() for path in output_csv_paths}
+        if len(qti_xml_filenames) > 1 and (os.cpu_count() or 1) > 1 and len(distinct_paths) == len(output_csv_paths):
+            with ProcessPoolExecutor() as executor:
+                for output_csv_path in executor.map(convert_quiz, itertools.repeat(zip_file_path), qti_xml_filenames, output_csv_paths):
                     print(f"Successfully created CSV file at: {output_csv_path}")
+        else:
+            for qti_xml_filename, output_csv_path in zip(qti_xml_filenames, output_csv_paths):
+                convert_quiz(zip_file_path, qti_xml_filename, output_csv_path)
+                print(f"Successfully created CSV file at: {output_csv_path}")
 
     except FileNotFoundError:
         print(f"Error: The file '{zip_file_path}' was not found.")
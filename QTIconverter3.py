@@ -1,21 +1,194 @@
 import csv
-import xml.etree.ElementTree as ET
+from xml.parsers import expat
 import re
 import zipfile
 import argparse
 import html
+import functools
 import sys
 import traceback
 
+_TAG_RE = re.compile('<[^<]+?>')
+
 def clean_text(raw_text):
     """Removes HTML tags and unescapes entities (e.g. &amp; -> &)."""
     if not raw_text:
         return ""
+    return _clean_cached(raw_text)
+
+@functools.lru_cache(maxsize=4096)
+def _clean_cached(raw_text):
     # Strip HTML tags
-    clean = re.sub('<[^<]+?>', '', raw_text)
+    clean = _TAG_RE.sub('', raw_text)
     # Fix entities (e.g. &nbsp;, &gt;)
     return html.unescape(clean).strip()
 
+# Element names as expat reports them with namespace_separator='}': the
+# namespace URI, then '}', then the local name
+_IMS = 'http://www.imsglobal.org/xsd/ims_qtiasiv1p2}'
+_ITEM = _IMS + 'item'
+_ITEMMETADATA = _IMS + 'itemmetadata'
+_QTIMETADATAFIELD = _IMS + 'qtimetadatafield'
+_FIELDLABEL = _IMS + 'fieldlabel'
+_FIELDENTRY = _IMS + 'fieldentry'
+_PRESENTATION = _IMS + 'presentation'
+_RESPONSE_LABEL = _IMS + 'response_label'
+_MATTEXT = _IMS + 'mattext'
+_RESPCONDITION = _IMS + 'respcondition'
+_SETVAR = _IMS + 'setvar'
+_VAREQUAL = _IMS + 'varequal'
+_ITEMFEEDBACK = _IMS + 'itemfeedback'
+
+# Elements whose text is kept; everything else only matters for its position
+_TEXT_TAGS = frozenset((_FIELDLABEL, _FIELDENTRY, _MATTEXT, _SETVAR, _VAREQUAL))
+
+# question_type values that are converted; "" covers items without the metadata
+SUPPORTED_TYPES = frozenset(('multiple_choice_question', 'true_false_question', 'multiple_response_question', ''))
+
+# "No such element seen yet", as opposed to an element with no text (None)
+_UNSET = object()
+
+class ItemScanner:
+    """
+    Collects everything the CSV needs from each <item> straight from expat's callbacks.
+
+    No element tree is built: the only state kept is the current item's fields.
+    Each <mattext>, <setvar> and <varequal> is attributed to the containers
+    (presentation, response_label, respcondition, itemfeedback) open around it,
+    and only the first one in each container counts, as with find(). Text is
+    what ElementTree's .text would hold: the character data before the first
+    child element, or None if that is empty.
+
+    Once <itemmetadata> closes with an unsupported question_type, the rest of
+    the item is not read.
+
+    Each finished item is appended to self.items as a tuple: (title attribute or
+    None, metadata dict of label -> entry text, body text or None, list of
+    (answer ident, text or None), correct answer ident or None, dict of
+    feedback ident -> text or None).
+    """
+
+    def __init__(self):
+        self.items = []
+        self.in_item = False    # assessment- and section-level metadata is ignored
+        self.skipping = False   # inside an item of an unsupported type
+        self.text = []          # character data of the text element being read
+        self.text_tag = None    # the text element currently being read, if any
+        self.text_head = None   # its text up to the first child element, once one opens
+        self.setvar_action = None
+        self.parser = expat.ParserCreate(namespace_separator='}')
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+
+    def start(self, name, attrs):
+        if self.skipping:
+            return
+        if self.text_tag is not None:
+            if self.text_head is None:
+                self.text_head = ''.join(self.text)
+        elif name in _TEXT_TAGS and self.in_item:
+            self.text_tag = name
+            self.text_head = None
+            self.text.clear()
+            # Character data is only collected inside text elements
+            self.parser.CharacterDataHandler = self.text.append
+            if name == _SETVAR:
+                self.setvar_action = attrs.get('action')
+        elif name == _ITEM:
+            self.in_item = True
+            self.title = attrs.get('title')
+            self.meta = {}
+            self.field_label = self.field_entry = _UNSET
+            self.body, self.in_presentation = _UNSET, False
+            self.labels, self.label = [], None
+            self.conditions, self.condition = [], None # [first Set <setvar> text, first <varequal> text]
+            self.feedbacks, self.feedback_ident = {}, None
+        elif name == _QTIMETADATAFIELD:
+            self.field_label = self.field_entry = _UNSET
+        elif name == _PRESENTATION:
+            self.in_presentation = True
+        elif name == _RESPONSE_LABEL:
+            self.label = [attrs.get('ident'), _UNSET]
+            self.labels.append(self.label)
+        elif name == _RESPCONDITION:
+            self.condition = [_UNSET, _UNSET]
+            self.conditions.append(self.condition)
+        elif name == _ITEMFEEDBACK:
+            self.feedback_ident = attrs.get('ident')
+            self.feedbacks[self.feedback_ident] = _UNSET
+
+    def end(self, name):
+        if self.skipping:
+            if name == _ITEM:
+                self.in_item = self.skipping = False
+                self.items.append((self.title, self.meta, None, [], None, {}))
+            return
+        if name == self.text_tag:
+            self.text_tag = None
+            self.parser.CharacterDataHandler = None
+            text = (self.text_head if self.text_head is not None else ''.join(self.text)) or None
+            if name == _MATTEXT:
+                if self.in_presentation and self.body is _UNSET:
+                    self.body = text
+                if self.label is not None:
+                    if self.label[1] is _UNSET:
+                        self.label[1] = text
+                elif self.feedback_ident is not None and self.feedbacks[self.feedback_ident] is _UNSET:
+                    self.feedbacks[self.feedback_ident] = text
+            elif name == _FIELDLABEL:
+                if self.field_label is _UNSET:
+                    self.field_label = text
+            elif name == _FIELDENTRY:
+                if self.field_entry is _UNSET:
+                    self.field_entry = text
+            elif self.condition is not None:
+                if name == _SETVAR:
+                    if self.condition[0] is _UNSET and self.setvar_action == 'Set':
+                        self.condition[0] = text
+                elif self.condition[1] is _UNSET: # _VAREQUAL
+                    self.condition[1] = text
+        elif name == _RESPONSE_LABEL:
+            self.label = None
+        elif name == _RESPCONDITION:
+            self.condition = None
+        elif name == _ITEMFEEDBACK:
+            self.feedback_ident = None
+        elif name == _PRESENTATION:
+            self.in_presentation = False
+        elif name == _QTIMETADATAFIELD:
+            # A labelled field without an entry reads as ""; unlabelled fields are ignored
+            if self.field_label is not _UNSET:
+                self.meta[self.field_label] = "" if self.field_entry is _UNSET else self.field_entry
+            self.field_label = self.field_entry = _UNSET
+        elif name == _ITEMMETADATA:
+            if self.in_item and self.meta.get('question_type', "") not in SUPPORTED_TYPES:
+                self.skipping = True
+        elif name == _ITEM:
+            self.in_item = False
+            # The first condition that sets the score to 100 names the correct answer
+            correct_id = next((varequal for setvar, varequal in self.conditions
+                               if setvar == '100' and varequal is not _UNSET), None)
+            body = None if self.body is _UNSET else self.body
+            labels = [(ident, None if text is _UNSET else text) for ident, text in self.labels]
+            feedbacks = {ident: None if text is _UNSET else text for ident, text in self.feedbacks.items()}
+            self.items.append((self.title, self.meta, body, labels, correct_id, feedbacks))
+
+def iter_items(xml_file):
+    """
+    Yields ItemScanner's tuple for each <item> in a QTI XML file.
+
+    The file is fed to expat in 64 KiB blocks and finished items are handed
+    out after each block, so memory stays bounded by a block's worth of items.
+    """
+    scanner = ItemScanner()
+    for block in iter(lambda: xml_file.read(1 << 16), b''):
+        scanner.parser.Parse(block, False)
+        yield from scanner.items
+        scanner.items.clear()
+    scanner.parser.Parse(b'', True)
+    yield from scanner.items
+
 def convert_qti_to_csv(zip_file_path, output_csv_path):
     try:
         with zipfile.ZipFile(zip_file_path, 'r') as z:
@@ -28,15 +201,6 @@ def convert_qti_to_csv(zip_file_path, output_csv_path):
                 return
 
             with z.open(qti_files[0]) as xml_file:
-                try:
-                    tree = ET.parse(xml_file)
-                except ET.ParseError as e:
-                    print(f"Error: Could not parse XML file. {e}")
-                    return
-                    
-                ns = {'ims': 'http://www.imsglobal.org/xsd/ims_qtiasiv1p2'}
-                root = tree.getroot()
-
                 fieldnames = [
                     'Type', 'Title', 'Points', 'Question Body',
                     'Correct Answer', 'Option 1', 'Option 2', 'Option 3', 
@@ -45,108 +209,97 @@ def convert_qti_to_csv(zip_file_path, output_csv_path):
                     'Feedback 1', 'Feedback 2', 'Feedback 3',
                     'Feedback 4', 'Feedback 5'
                 ]
+                # Rows are plain lists; resolve each column's position once
+                col_idx = {name: idx for idx, name in enumerate(fieldnames)}
+                TYPE, TITLE, POINTS, BODY, CORRECT = (col_idx[name] for name in ('Type', 'Title', 'Points', 'Question Body', 'Correct Answer'))
+                GENERAL_FB, CORRECT_FB, INCORRECT_FB = (col_idx[name] for name in ('General Feedback', 'Correct Feedback', 'Incorrect Feedback'))
+                OPTS = tuple(col_idx[f'Option {x}'] for x in range(1, 6))
+                FBS = tuple(col_idx[f'Feedback {x}'] for x in range(1, 6))
 
-                # FIX: Use 'utf-8-sig' to add the BOM for Excel compatibility
-                with open(output_csv_path, 'w', newline='', encoding='utf-8-sig') as csv_file:
-                    writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-                    writer.writeheader()
-
-                    count = 0
-                    skipped_count = 0
+                rows = []
+                count = 0
+                skipped_count = 0
 
-                    for item in root.findall('.//ims:item', ns):
-                        row = {key: "" for key in fieldnames}
-                        
+                # The whole file is parsed before the CSV is opened, so a malformed
+                # export leaves an existing CSV alone
+                try:
+                    for title, meta, body, labels, correct_id, feedback_texts in iter_items(xml_file):
                         # --- 1. Validation: Check Question Type ---
                         is_supported_type = False
-                        q_type_metadata = ""
-                        
-                        for field in item.findall('.//ims:qtimetadatafield', ns):
-                            label = field.find('ims:fieldlabel', ns)
-                            entry = field.find('ims:fieldentry', ns)
-                            
-                            if label is not None and label.text == 'question_type':
-                                q_type_metadata = entry.text if entry is not None else ""
-                            
-                            # Also grab points while we are looping through metadata
-                            if label is not None and label.text == 'points_possible':
-                                raw_points = entry.text if entry is not None else "0"
-                                try:
-                                    row['Points'] = f"{float(raw_points):.2f}"
-                                except ValueError:
-                                    row['Points'] = "0.00"
+                        q_type_metadata = meta.get('question_type', "")
 
                         # Allow MC, True/False, or if metadata is missing
-                        if q_type_metadata in ['multiple_choice_question', 'true_false_question', 'multiple_response_question', '']:
+                        if q_type_metadata in SUPPORTED_TYPES:
                             is_supported_type = True
                         
                         if not is_supported_type:
-                            print(f"Skipping unsupported question type: {q_type_metadata} (Item Title: {item.get('title')})")
+                            print(f"Skipping unsupported question type: {q_type_metadata} (Item Title: {title})")
                             skipped_count += 1
                             continue
 
+                        row = [""] * len(fieldnames)
+
+                        raw_points = meta.get('points_possible')
+                        if raw_points is not None:
+                            try:
+                                row[POINTS] = f"{float(raw_points):.2f}"
+                            except ValueError:
+                                row[POINTS] = "0.00"
+
                         # --- 2. Extract Basic Data ---
-                        row['Title'] = item.get('title', 'Question')
+                        row[TITLE] = title if title is not None else 'Question'
                         
-                        mattext = item.find('.//ims:presentation//ims:mattext', ns)
-                        if mattext is not None:
-                            row['Question Body'] = clean_text(mattext.text)
+                        row[BODY] = clean_text(body)
 
                         # --- 3. Extract Answers ---
-                        labels = item.findall('.//ims:render_choice/ims:response_label', ns)
                         answer_ids = []
                         answer_texts = []
+                        id_to_pos = {}
                         
-                        for i, label in enumerate(labels):
-                            if i >= 5: break
-                            text_elem = label.find('.//ims:mattext', ns)
-                            text = clean_text(text_elem.text) if text_elem is not None else ""
+                        for i, (ident, raw_text) in enumerate(labels[:5]):
+                            text = clean_text(raw_text)
                             
-                            row[f'Option {i+1}'] = text
-                            answer_ids.append(label.get('ident'))
+                            row[OPTS[i]] = text
+                            answer_ids.append(ident)
+                            id_to_pos.setdefault(ident, i)
                             answer_texts.append(text)
 
                         # --- 4. Robust Type Detection ---
                         # Check for True/False regardless of case (True, TRUE, true)
                         lower_answers = [a.lower() for a in answer_texts]
                         if len(answer_texts) == 2 and "true" in lower_answers and "false" in lower_answers:
-                            row['Type'] = "TF"
+                            row[TYPE] = "TF"
                         else:
-                            row['Type'] = "MC"
+                            row[TYPE] = "MC"
 
                         # --- 5. Correct Answer ---
-                        correct_id = None
-                        for cond in item.findall('.//ims:respcondition', ns):
-                            # Safety check: ensure setvar exists
-                            setvar = cond.find(".//ims:setvar[@action='Set']", ns)
-                            if setvar is not None and setvar.text == '100':
-                                varequal = cond.find(".//ims:varequal", ns)
-                                if varequal is not None:
-                                    correct_id = varequal.text
-                                    break
-                        
-                        if correct_id in answer_ids:
-                            row['Correct Answer'] = str(answer_ids.index(correct_id) + 1)
+                        correct_pos = id_to_pos.get(correct_id)
+                        if correct_pos is not None:
+                            row[CORRECT] = str(correct_pos + 1)
 
                         # --- 6. Feedback ---
-                        feedbacks = {}
-                        for fb in item.findall('.//ims:itemfeedback', ns):
-                            ident = fb.get('ident')
-                            txt = fb.find('.//ims:mattext', ns)
-                            feedbacks[ident] = clean_text(txt.text) if txt is not None else ""
-
-                        row['General Feedback'] = feedbacks.get('general_fb', '')
-                        row['Correct Feedback'] = feedbacks.get('correct_fb', '')
-                        row['Incorrect Feedback'] = feedbacks.get('general_incorrect_fb', '')
-
-                        for i, aid in enumerate(answer_ids):
-                            key = f"{aid}_fb"
-                            if key in feedbacks:
-                                row[f'Feedback {i+1}'] = feedbacks[key]
-
-                        writer.writerow(row)
+                        if feedback_texts:
+                            feedbacks = {ident: clean_text(txt) for ident, txt in feedback_texts.items()}
+
+                            row[GENERAL_FB] = feedbacks.get('general_fb', '')
+                            row[CORRECT_FB] = feedbacks.get('correct_fb', '')
+                            row[INCORRECT_FB] = feedbacks.get('general_incorrect_fb', '')
+
+                            for i, aid in enumerate(answer_ids):
+                                row[FBS[i]] = feedbacks.get(f"{aid}_fb", '')
+
+                        rows.append(row)
                         count += 1
-                        
+                except expat.ExpatError as e:
+                    print(f"Error: Could not parse XML file. {e}")
+                    return
+
+                # FIX: Use 'utf-8-sig' to add the BOM for Excel compatibility
+                with open(output_csv_path, 'w', newline='', encoding='utf-8-sig', buffering=1 << 20) as csv_file:
+                    writer = csv.writer(csv_file)
+                    writer.writerow(fieldnames)
+                    writer.writerows(rows)
+
                 print(f"Success! Extracted {count} questions to: {output_csv_path}")
                 if skipped_count > 0:
                     print(f"Warning: {skipped_count} items were skipped because they were not Multiple Choice or True/False.")